@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Write Coalescing Benchmark
+Compares one send() per frame with the coalescing writer for server fan-out
+and for a bursty single sender, reporting syscalls per message and throughput
+"""
+
+import os
+import sys
+import socket
+import threading
+import time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from protocol import CODECS, CoalescingWriter
+
+
+def make_frame(index):
+    """Build a typical chat frame"""
+    return CODECS['json'].encode({'username': 'bench', 'text': f"message number {index} " + "x" * 60})
+
+
+def drain(sock, expected, done):
+    """Read from a socket until the expected number of bytes arrived"""
+    received = 0
+    while received < expected:
+        data = sock.recv(65536)
+        if not data:
+            break
+        received += len(data)
+    done.set()
+
+
+def run_scenario(recipients, messages, coalesce, window):
+    """Send messages to every recipient and return (syscalls, seconds)"""
+    frames = [make_frame(i) for i in range(messages)]
+    expected = sum(len(frame) for frame in frames)
+    pairs = [socket.socketpair() for _ in range(recipients)]
+    events = []
+    for _, reader in pairs:
+        done = threading.Event()
+        threading.Thread(target=drain, args=(reader, expected, done), daemon=True).start()
+        events.append(done)
+
+    writers = [CoalescingWriter(sender, window=window) for sender, _ in pairs] if coalesce else []
+    syscalls = 0
+    start = time.perf_counter()
+    for frame in frames:
+        # Same shape as ServerSocketHandler.broadcast: every frame goes to every recipient
+        for index, (sender, _) in enumerate(pairs):
+            if coalesce:
+                writers[index].write(frame)
+            else:
+                sender.sendall(frame)
+                syscalls += 1
+    for writer in writers:
+        writer.close(flush=True)
+        syscalls += writer.syscalls
+    for done in events:
+        done.wait()
+    elapsed = time.perf_counter() - start
+
+    for sender, reader in pairs:
+        sender.close()
+        reader.close()
+    return syscalls, elapsed
+
+
+def main():
+    """Run all scenarios and print a results table"""
+    scenarios = [
+        ("bursty sender (multi-line paste)", 1, 200),
+        ("fan-out, 10 recipients", 10, 1000),
+        ("fan-out, 50 recipients (catch-up)", 50, 2000),
+    ]
+    window = 0.002
+
+    print(f"{'='*88}")
+    print(f"{'Scenario':<36}{'Mode':<12}{'Syscalls':>10}{'Sys/msg':>10}{'Msgs/s':>12}{'MB/s':>8}")
+    print(f"{'='*88}")
+    for name, recipients, messages in scenarios:
+        total_bytes = sum(len(make_frame(i)) for i in range(messages)) * recipients
+        for mode, coalesce in (("send", False), ("coalesced", True)):
+            syscalls, elapsed = run_scenario(recipients, messages, coalesce, window)
+            delivered = messages * recipients
+            print(
+                f"{name:<36}{mode:<12}{syscalls:>10}{syscalls / delivered:>10.3f}"
+                f"{delivered / elapsed:>12.0f}{total_bytes / elapsed / 1e6:>8.1f}"
+            )
+    print(f"{'='*88}")
+    print(f"Coalescing window: {window * 1000:.1f} ms. Sys/msg counts write syscalls per delivered message.")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,9 @@ from rich.text import Text
 from rich.panel import Panel
 from rich.prompt import Prompt
 from rich.align import Align
+from rich.table import Table
 from socket_handler import ClientSocketHandler
+from latency import LatencyTracker, new_trace, stamp
 
 # Initialize colorama for Windows compatibility
 init(autoreset=True)
@@ -27,10 +29,14 @@ load_dotenv()
 
 server_ip = os.getenv("SERVER_IP")
 port = int(os.getenv("PORT"))
+tor_proxy_host = os.getenv("TOR_PROXY_HOST", "127.0.0.1")
+tor_proxy_port = int(os.getenv("TOR_PROXY_PORT", 9050))
+codec = os.getenv("CODEC", "json")
+latency_trace = os.getenv("LATENCY_TRACE", "0").lower() in ("1", "true", "yes")
 
 class ChatClient:
     def __init__(self):
-        self.socket_handler = ClientSocketHandler(server_ip, port)
+        self.socket_handler = ClientSocketHandler(server_ip, port, tor_proxy_host, tor_proxy_port, codec)
         self.username = None
         self.user_colors = {}
         self.available_colors = [
@@ -42,6 +48,7 @@ class ChatClient:
         self.message_history = []
         self.running = True
         self.display_lock = threading.Lock()
+        self.latency_tracker = LatencyTracker()
         
     def get_user_color(self, username):
         """Get or assign a color for a username"""
@@ -113,7 +120,7 @@ class ChatClient:
     
     def display_chat_header(self):
         """Display chat header with connection info"""
-        header_text = f"Connected to {server_ip}:{port} | User: {self.username} | Type 'exit' to quit"
+        header_text = f"Connected to {server_ip}:{port} | User: {self.username} | Type 'exit' to quit, '/latency' for timings"
         console.print(f"[dim]{header_text}[/dim]")
         console.print("─" * len(header_text))
         console.print()
@@ -141,6 +148,11 @@ class ChatClient:
             # Stream the message on a new line
             self.stream_text(text, username, color)
             
+            # Record per-hop latency once the message is fully rendered
+            if 'trace' in message_data:
+                stamp(message_data, 'r_render')
+                self.latency_tracker.record_trace(message_data['trace'])
+            
             # Ensure we're on a new line after the message
             print()
             
@@ -167,8 +179,33 @@ class ChatClient:
             'text': text.strip()
         }
         
+        if latency_trace:
+            message_data['trace'] = new_trace()
+        
         return self.socket_handler.send_message(message_data)
     
+    def show_latency(self, args):
+        """Show per-hop latency histograms, or export them with '/latency export [path]'"""
+        with self.display_lock:
+            if args and args[0] == 'export':
+                path = args[1] if len(args) > 1 else f"latency-{int(time.time())}.json"
+                try:
+                    self.latency_tracker.export_json(path)
+                    console.print(f"[green]Latency histograms exported to {path}[/green]")
+                except OSError as e:
+                    console.print(f"[red]Failed to export latency histograms: {e}[/red]")
+                return
+            
+            table = Table(title="Message latency per hop (ms)")
+            table.add_column("Hop", style="cyan")
+            for column in ("Count", "p50", "p90", "p99", "Max"):
+                table.add_column(column, justify="right")
+            for name, count, p50, p90, p99, max_ms in self.latency_tracker.summary_rows():
+                table.add_row(name, str(count), f"{p50:.1f}", f"{p90:.1f}", f"{p99:.1f}", f"{max_ms:.1f}")
+            console.print(table)
+            if not latency_trace:
+                console.print("[dim]Tracing is off for your own messages; set LATENCY_TRACE=1 to enable it[/dim]")
+    
     def run(self):
         """Main chat loop"""
         try:
@@ -206,6 +243,9 @@ class ChatClient:
                         self.running = False
                         self.send_message(f"{self.username} left the chat!")
                         break
+                    elif user_input.split()[:1] == ['/latency']:
+                        self.show_latency(user_input.split()[1:])
+                        print(self.get_input_prompt(), end="", flush=True)
                     elif user_input.strip():
                         self.send_message(user_input)
                         # Redraw prompt after sending message
@@ -0,0 +1,156 @@
+"""
+Client Latency Tracker Module
+Aggregates per-hop message latency from trace stamps into HDR-style histograms
+"""
+
+import json
+import math
+import time
+import threading
+from protocol import clean_trace
+
+# Hops between consecutive stamps, plus the full end-to-end path.
+# s_fan_end is taken when the server's coalescing writer flushes the recipient's
+# batch, so 'fanout' includes the write queue and coalescing window, while
+# 'downlink' covers the sendmsg call and the network.
+HOPS = [
+    ('uplink', 'c_send', 's_recv'),
+    ('server', 's_recv', 's_fan_start'),
+    ('fanout', 's_fan_start', 's_fan_end'),
+    ('downlink', 's_fan_end', 'r_recv'),
+    ('render', 'r_recv', 'r_render'),
+    ('total', 'c_send', 'r_render'),
+]
+
+
+def new_trace():
+    """Create a trace dict stamped with the client send time"""
+    return {'c_send': time.time()}
+
+
+def stamp(message_data, name):
+    """Stamp a traced message with the current time, if it carries a trace"""
+    trace = message_data.get('trace')
+    if isinstance(trace, dict):
+        trace[name] = time.time()
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of latencies in microseconds
+
+    Values below 2**sub_bucket_bits are counted exactly, larger values are
+    grouped into buckets whose width grows with the magnitude of the value,
+    keeping the relative error under 2 / 2**sub_bucket_bits.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.total_count = 0
+        self.total_sum = 0
+        self.min_value = None
+        self.max_value = None
+
+    def _bucket_for(self, value):
+        """Return the (shift, sub_bucket) key for a value"""
+        shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return shift, value >> shift
+
+    def record(self, value_us):
+        """Record a latency in microseconds; negative values (clock skew) count as 0"""
+        value = max(int(value_us), 0)
+        key = self._bucket_for(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total_count += 1
+        self.total_sum += value
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+    def percentile(self, percent):
+        """Get the value at the given percentile (0-100)"""
+        if not self.total_count:
+            return 0
+        target = max(1, -(-self.total_count * percent // 100))
+        seen = 0
+        for shift, sub_bucket in sorted(self.counts, key=lambda k: k[1] << k[0]):
+            seen += self.counts[(shift, sub_bucket)]
+            if seen >= target:
+                # Report the highest value the bucket can hold, capped at the real max
+                return min(((sub_bucket + 1) << shift) - 1, self.max_value)
+        return self.max_value
+
+    def mean(self):
+        """Get the mean latency in microseconds"""
+        return self.total_sum / self.total_count if self.total_count else 0
+
+    def to_dict(self):
+        """Export the histogram as a JSON-serializable dict"""
+        return {
+            'count': self.total_count,
+            'min_us': self.min_value or 0,
+            'max_us': self.max_value or 0,
+            'mean_us': round(self.mean(), 1),
+            'p50_us': self.percentile(50),
+            'p90_us': self.percentile(90),
+            'p99_us': self.percentile(99),
+            'p999_us': self.percentile(99.9),
+            'buckets': [
+                {'from_us': sub_bucket << shift, 'to_us': ((sub_bucket + 1) << shift) - 1, 'count': count}
+                for (shift, sub_bucket), count in sorted(self.counts.items(), key=lambda i: i[0][1] << i[0][0])
+            ],
+        }
+
+
+class LatencyTracker:
+    """Collects trace stamps from received messages into per-hop histograms"""
+
+    def __init__(self):
+        self.histograms = {name: LatencyHistogram() for name, _, _ in HOPS}
+        self.lock = threading.Lock()
+
+    def record_trace(self, trace):
+        """Record every hop for which both stamps are present and valid"""
+        trace = clean_trace(trace)
+        if trace is None:
+            return
+        with self.lock:
+            for name, start, end in HOPS:
+                if start in trace and end in trace:
+                    elapsed_us = (trace[end] - trace[start]) * 1_000_000
+                    # Finite stamps can still be far enough apart to overflow
+                    if math.isfinite(elapsed_us):
+                        self.histograms[name].record(elapsed_us)
+
+    def summary_rows(self):
+        """Get (hop, count, p50, p90, p99, max) rows in milliseconds"""
+        rows = []
+        with self.lock:
+            for name, _, _ in HOPS:
+                histogram = self.histograms[name]
+                rows.append((
+                    name,
+                    histogram.total_count,
+                    histogram.percentile(50) / 1000,
+                    histogram.percentile(90) / 1000,
+                    histogram.percentile(99) / 1000,
+                    (histogram.max_value or 0) / 1000,
+                ))
+        return rows
+
+    def to_dict(self):
+        """Export all hop histograms as a JSON-serializable dict"""
+        with self.lock:
+            return {
+                'hops': {
+                    name: dict(self.histograms[name].to_dict(), start=start, end=end)
+                    for name, start, end in HOPS
+                }
+            }
+
+    def export_json(self, path):
+        """Write all hop histograms to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
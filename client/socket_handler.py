@@ -6,17 +6,28 @@ Handles all socket connections and message communication for the chat client
 import socket
 import socks  # PySocks for Tor proxy support
 import threading
-import json
 import time
 from colorama import init, Fore, Style
+from protocol import CODECS, DEFAULT_CODEC, CoalescingWriter, get_codec
+from latency import stamp
 
 # Initialize colorama for Windows compatibility
 init(autoreset=True)
 
 class ClientSocketHandler:
-    def __init__(self, host, port):
+    def __init__(self, host, port, proxy_host="127.0.0.1", proxy_port=9050, codec=DEFAULT_CODEC, write_window=0.002):
         self.host = host
         self.port = port
+        self.proxy_host = proxy_host
+        self.proxy_port = proxy_port
+        self.preferred_codec = codec
+        self.codec = CODECS[DEFAULT_CODEC]
+        self.buffer = bytearray()
+        self.early_messages = []  # Chat messages that arrived during codec negotiation
+        self.codec_pending = False  # True while a codec offer awaits the server's reply
+        self.held_messages = []  # Outgoing messages held until the codec is settled
+        self.write_window = write_window  # Seconds outgoing frames are coalesced before a flush
+        self.writer = None
         self.socket = None
         self.connected = False
         self.running = False
@@ -44,8 +55,8 @@ class ClientSocketHandler:
             if self.host and self.host.endswith('.onion'):
                 # Use Tor SOCKS5 proxy
                 self.socket = socks.socksocket()
-                self.socket.set_proxy(socks.SOCKS5, "127.0.0.1", 9050)
-                self.log_message(f"Connecting to {self.host}:{self.port} via Tor SOCKS5 proxy")
+                self.socket.set_proxy(socks.SOCKS5, self.proxy_host, self.proxy_port)
+                self.log_message(f"Connecting to {self.host}:{self.port} via Tor SOCKS5 proxy at {self.proxy_host}:{self.proxy_port}")
             else:
                 self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.log_message(f"Connecting to {self.host}:{self.port} directly")
@@ -53,6 +64,9 @@ class ClientSocketHandler:
             self.connected = True
             self.running = True
             self.log_message(f"Connected to {self.host}:{self.port}")
+            self.writer = CoalescingWriter(self.socket, window=self.write_window, error_callback=self.handle_write_error)
+            if self.preferred_codec != DEFAULT_CODEC:
+                self.negotiate_codec()
             return True
         except Exception as e:
             self.log_message(f"Failed to connect to server: {e}", "ERROR")
@@ -60,11 +74,95 @@ class ClientSocketHandler:
                 self.error_callback(f"Connection failed: {e}")
             return False
     
+    def negotiate_codec(self, timeout=5, give_up_after=60):
+        """Offer the preferred codec to the server and switch to the one it picks
+
+        The server keeps sending JSON broadcasts until its reply, so chat messages
+        read before the reply are kept for the receive thread. If the reply takes
+        longer than timeout, connecting goes ahead and the receive thread applies
+        the reply when it arrives; outgoing messages are held until then. The server
+        may already have switched codec, so falling back to JSON is never safe: with
+        no reply after give_up_after seconds the connection is closed instead.
+        """
+        json_codec = CODECS[DEFAULT_CODEC]
+        offer = [self.preferred_codec, DEFAULT_CODEC]
+        self.codec_pending = True
+        try:
+            self.socket.settimeout(timeout)
+            self.socket.sendall(json_codec.encode({'type': 'hello', 'codecs': offer}))
+            
+            # Anything after the reply already uses the new codec, so read frame by frame
+            while True:
+                try:
+                    frame = json_codec.next_frame(self.buffer)
+                except ValueError as e:
+                    self.log_message(f"Received invalid {json_codec.name} frame: {e}", "ERROR")
+                    continue
+                if frame is None:
+                    data = self.socket.recv(1024)
+                    if not data:
+                        raise ConnectionError("Connection closed during codec negotiation")
+                    self.buffer += data
+                    continue
+                
+                if self.is_codec_reply(frame):
+                    self.apply_codec_reply(frame)
+                    break
+                if frame.header.get('type') == 'hello':
+                    continue
+                stamp(frame.message(), 'r_recv')
+                self.early_messages.append(frame.message())
+        except socket.timeout:
+            self.log_message("No codec reply yet, holding outgoing messages until it arrives", "WARNING")
+            timer = threading.Timer(give_up_after, self.abandon_codec_negotiation)
+            timer.daemon = True
+            timer.start()
+        finally:
+            if self.socket:
+                self.socket.settimeout(None)
+    
+    def is_codec_reply(self, frame):
+        """Check for the server's hello reply; offers relayed by an old server name no codec"""
+        return frame.header.get('type') == 'hello' and 'codec' in frame.message()
+    
+    def apply_codec_reply(self, frame):
+        """Switch to the codec the server picked and send any messages held meanwhile"""
+        with self.lock:
+            if not self.codec_pending:
+                return
+            self.codec = get_codec(frame.message().get('codec'))
+            self.codec_pending = False
+            held, self.held_messages = self.held_messages, []
+            for message_data in held:
+                self.writer.write(self.codec.encode(message_data))
+        self.log_message(f"Using {self.codec.name} codec")
+    
+    def abandon_codec_negotiation(self):
+        """Close the connection if the server never answered the codec offer"""
+        with self.lock:
+            if not self.codec_pending or not self.connected:
+                return
+        self.log_message("Server never answered codec negotiation", "ERROR")
+        if self.error_callback:
+            self.error_callback("Codec negotiation failed; set CODEC=json for servers without codec support")
+        self.disconnect()
+    
+    def handle_write_error(self, error):
+        """Handle a failed flush from the coalescing writer"""
+        self.log_message(f"Failed to send message: {error}", "ERROR")
+        if self.error_callback:
+            self.error_callback(f"Send failed: {error}")
+    
     def disconnect(self):
         """Disconnect from the server"""
         self.running = False
         self.connected = False
         
+        # Deliver anything still queued, such as the leave message, before closing
+        if self.writer:
+            self.writer.close(flush=True)
+            self.writer = None
+        
         if self.socket:
             try:
                 self.socket.close()
@@ -81,8 +179,13 @@ class ClientSocketHandler:
             return False
         
         try:
-            message_json = json.dumps(message_data) + "\n"
-            self.socket.send(message_json.encode())
+            with self.lock:
+                # Until the server answers the codec offer, neither codec is safe to send
+                if self.codec_pending:
+                    self.held_messages.append(message_data)
+                    return True
+                if not self.writer.write(self.codec.encode(message_data)):
+                    raise ConnectionError("send queue closed or full")
             return True
         except Exception as e:
             self.log_message(f"Failed to send message: {e}", "ERROR")
@@ -92,28 +195,43 @@ class ClientSocketHandler:
     
     def receive_messages(self):
         """Handle incoming messages from server"""
-        buffer = ""
+        buffer = self.buffer
+        
+        # Deliver chat messages that arrived while the codec was being negotiated
+        for message_data in self.early_messages:
+            if self.message_callback:
+                self.message_callback(message_data)
+        self.early_messages = []
+        
         while self.running and self.connected:
             try:
-                data = self.socket.recv(1024)
-                if not data:
-                    break
-                    
-                buffer += data.decode()
-                
-                # Process newline-delimited JSON messages
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if not line.strip():
+                # Process complete frames with the negotiated codec, starting with
+                # any that arrived together with the codec negotiation reply
+                while True:
+                    try:
+                        frame = self.codec.next_frame(buffer)
+                        if frame is None:
+                            break
+                        message_data = frame.message()
+                    except ValueError as e:
+                        self.log_message(f"Received invalid {self.codec.name} frame: {e}", "ERROR")
                         continue
                     
-                    try:
-                        message_data = json.loads(line)
-                        if self.message_callback:
-                            self.message_callback(message_data)
-                    except json.JSONDecodeError:
-                        self.log_message(f"Received invalid JSON: {line}", "ERROR")
+                    # Hello frames are protocol control messages, never chat;
+                    # a late reply switches codec for the frames after it
+                    if frame.header.get('type') == 'hello':
+                        if self.codec_pending and self.is_codec_reply(frame):
+                            self.apply_codec_reply(frame)
                         continue
+                    
+                    stamp(message_data, 'r_recv')
+                    if self.message_callback:
+                        self.message_callback(message_data)
+                
+                data = self.socket.recv(1024)
+                if not data:
+                    break
+                buffer += data
                         
             except Exception as e:
                 if self.running:
@@ -0,0 +1,8 @@
+"""
+Wire protocol package for Dark Comm Terminal Chat
+"""
+
+from .codec import CODECS, DEFAULT_CODEC, Frame, JsonCodec, CompactCodec, clean_trace, get_codec
+from .writer import CoalescingWriter
+
+__all__ = ['CODECS', 'DEFAULT_CODEC', 'Frame', 'JsonCodec', 'CompactCodec', 'clean_trace', 'get_codec', 'CoalescingWriter']
@@ -0,0 +1,280 @@
+"""
+Payload Codec Module
+Frame codecs shared by the chat client and server. Every message is split into
+an envelope header (the fields the server routes on) and a body, so frames can
+be forwarded without decoding the body.
+"""
+
+import json
+import math
+import struct
+
+# Fields that make up the envelope header; everything else is body
+HEADER_FIELDS = ('type', 'username', 'trace')
+
+# Largest encoded string field allowed in a header, well within the compact prefix limit
+MAX_HEADER_FIELD_SIZE = 1024
+
+DEFAULT_CODEC = 'json'
+
+
+def clean_trace(trace):
+    """Drop trace stamps that are not finite numbers, in place; returns None if trace is not a dict"""
+    if not isinstance(trace, dict):
+        return None
+    for name, value in list(trace.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            del trace[name]
+    return trace
+
+
+def validate_header(header):
+    """Check decoded header fields in place, raising ValueError for ones no codec can carry"""
+    for name in ('type', 'username'):
+        if name not in header:
+            continue
+        value = header[name]
+        if not isinstance(value, str):
+            raise ValueError(f"Header field {name} must be a string")
+        if len(value.encode()) > MAX_HEADER_FIELD_SIZE:
+            raise ValueError(f"Header field {name} is longer than {MAX_HEADER_FIELD_SIZE} bytes")
+    if 'trace' in header and clean_trace(header['trace']) is None:
+        del header['trace']
+    return header
+
+
+def split_message(message_data):
+    """Split a message dict into (header, body) dicts"""
+    header = {k: message_data[k] for k in HEADER_FIELDS if k in message_data}
+    body = {k: v for k, v in message_data.items() if k not in HEADER_FIELDS}
+    return header, body
+
+
+class Frame:
+    """A decoded envelope header plus the still-encoded body"""
+
+    def __init__(self, codec, header, body, raw):
+        self.codec = codec
+        self.header = header
+        self.body = body
+        self.raw = raw
+        self._message = None
+
+    def message(self):
+        """Get the full message dict, decoding the body on first use"""
+        if self._message is None:
+            self._message = dict(self.codec.decode_body(self.body), **self.header)
+        return self._message
+
+
+class JsonCodec:
+    """Newline-delimited JSON, the original wire format"""
+
+    name = 'json'
+
+    def encode(self, message_data):
+        """Encode a message dict into frame bytes"""
+        return (json.dumps(message_data) + "\n").encode()
+
+    def reencode(self, frame, header=None):
+        """Encode a frame whose header may have changed, or with a replacement header"""
+        return self.encode(dict(frame.message(), **header) if header else frame.message())
+
+    def decode_body(self, body):
+        """JSON frames are fully decoded on read, so the body is already a dict"""
+        return body
+
+    def next_frame(self, buffer):
+        """Remove and return the next frame from a bytearray, or None if incomplete
+
+        Raises ValueError for a malformed frame after removing it from the buffer.
+        """
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                return None
+            line = bytes(buffer[:end])
+            del buffer[:end + 1]
+            if not line.strip():
+                continue
+
+            message_data = json.loads(line.decode())
+            if not isinstance(message_data, dict):
+                raise ValueError(f"Expected a JSON object: {line!r}")
+            header, _ = split_message(message_data)
+            validate_header(header)
+            if 'trace' not in header:
+                message_data.pop('trace', None)
+            # Keep the header and body in one dict so header changes show up in message()
+            frame = Frame(self, header, message_data, line + b"\n")
+            frame._message = message_data
+            return frame
+
+
+class CompactCodec:
+    """Length-prefixed binary frames with integer field tags
+
+    frame  := magic (1 byte) | header length (2 bytes) | body length (4 bytes) | header | body
+    fields := (tag (1 byte) | value)*
+    Strings are a varint length followed by UTF-8, floats are 8-byte doubles.
+    Body fields without a tag of their own are carried as one JSON 'extra' field.
+    """
+
+    name = 'compact'
+
+    MAGIC = 0xDC
+    PREFIX = struct.Struct("!BHI")
+    DOUBLE = struct.Struct("!d")
+    MAX_FRAME_SIZE = 16 * 1024 * 1024
+    MAX_HEADER_SIZE = 4 * 1024
+
+    HEADER_TAGS = {1: 'username', 3: 'type'}
+    TRACE_TAGS = {16: 'c_send', 17: 's_recv', 18: 's_fan_start', 19: 's_fan_end', 20: 'r_recv', 21: 'r_render'}
+    BODY_TAGS = {2: 'text'}
+    EXTRA_TAG = 127
+
+    def __init__(self):
+        self.header_ids = {name: tag for tag, name in self.HEADER_TAGS.items()}
+        self.trace_ids = {name: tag for tag, name in self.TRACE_TAGS.items()}
+        self.body_ids = {name: tag for tag, name in self.BODY_TAGS.items()}
+
+    def _pack_string(self, out, tag, value):
+        data = str(value).encode()
+        out.append(tag)
+        length = len(data)
+        while length >= 0x80:
+            out.append((length & 0x7F) | 0x80)
+            length >>= 7
+        out.append(length)
+        out += data
+
+    def _unpack_string(self, data, pos):
+        length = shift = 0
+        while True:
+            if pos >= len(data):
+                raise ValueError("Truncated string length")
+            byte = data[pos]
+            pos += 1
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        end = pos + length
+        if end > len(data):
+            raise ValueError("Truncated string field")
+        return data[pos:end].decode(), end
+
+    def encode_header(self, header):
+        """Encode header fields into tagged bytes"""
+        out = bytearray()
+        for name, value in header.items():
+            if name == 'trace':
+                if not isinstance(value, dict):
+                    continue
+                for stamp_name, stamp_value in clean_trace(dict(value)).items():
+                    if stamp_name in self.trace_ids:
+                        out.append(self.trace_ids[stamp_name])
+                        out += self.DOUBLE.pack(stamp_value)
+            else:
+                self._pack_string(out, self.header_ids[name], value)
+        if len(out) > self.MAX_HEADER_SIZE:
+            raise ValueError(f"Header is longer than {self.MAX_HEADER_SIZE} bytes")
+        return bytes(out)
+
+    def decode_header(self, data):
+        """Decode tagged header bytes into a header dict"""
+        header = {}
+        pos = 0
+        while pos < len(data):
+            tag = data[pos]
+            pos += 1
+            if tag in self.TRACE_TAGS:
+                if pos + self.DOUBLE.size > len(data):
+                    raise ValueError("Truncated trace field")
+                value = self.DOUBLE.unpack_from(data, pos)[0]
+                pos += self.DOUBLE.size
+                trace = header.setdefault('trace', {})
+                # NaN and infinities are dropped like any other unusable stamp
+                if math.isfinite(value):
+                    trace[self.TRACE_TAGS[tag]] = value
+            elif tag in self.HEADER_TAGS:
+                header[self.HEADER_TAGS[tag]], pos = self._unpack_string(data, pos)
+            else:
+                raise ValueError(f"Unknown header tag {tag}")
+        return validate_header(header)
+
+    def encode_body(self, body):
+        """Encode body fields into tagged bytes"""
+        out = bytearray()
+        extra = {}
+        for name, value in body.items():
+            if name in self.body_ids and isinstance(value, str):
+                self._pack_string(out, self.body_ids[name], value)
+            else:
+                extra[name] = value
+        if extra:
+            self._pack_string(out, self.EXTRA_TAG, json.dumps(extra))
+        return bytes(out)
+
+    def decode_body(self, data):
+        """Decode tagged body bytes into a body dict"""
+        body = {}
+        pos = 0
+        while pos < len(data):
+            tag = data[pos]
+            pos += 1
+            if tag not in self.BODY_TAGS and tag != self.EXTRA_TAG:
+                raise ValueError(f"Unknown body tag {tag}")
+            value, pos = self._unpack_string(data, pos)
+            if tag == self.EXTRA_TAG:
+                extra = json.loads(value)
+                if not isinstance(extra, dict):
+                    raise ValueError("Extra body field must be a JSON object")
+                body.update(extra)
+            else:
+                body[self.BODY_TAGS[tag]] = value
+        return body
+
+    def pack(self, header_bytes, body_bytes):
+        """Join encoded header and body into frame bytes"""
+        return self.PREFIX.pack(self.MAGIC, len(header_bytes), len(body_bytes)) + header_bytes + body_bytes
+
+    def encode(self, message_data):
+        """Encode a message dict into frame bytes"""
+        header, body = split_message(message_data)
+        return self.pack(self.encode_header(header), self.encode_body(body))
+
+    def reencode(self, frame, header=None):
+        """Encode a frame whose header may have changed, or with a replacement header, reusing the body bytes as-is"""
+        return self.pack(self.encode_header(header or frame.header), frame.body)
+
+    def next_frame(self, buffer):
+        """Remove and return the next frame from a bytearray, or None if incomplete
+
+        Raises ValueError for a malformed frame after removing it from the buffer.
+        A bad prefix cannot be skipped reliably, so it clears the whole buffer.
+        """
+        if len(buffer) < self.PREFIX.size:
+            return None
+        magic, header_length, body_length = self.PREFIX.unpack_from(buffer)
+        if magic != self.MAGIC or body_length > self.MAX_FRAME_SIZE:
+            del buffer[:]
+            raise ValueError("Invalid compact frame prefix")
+        end = self.PREFIX.size + header_length + body_length
+        if len(buffer) < end:
+            return None
+
+        raw = bytes(buffer[:end])
+        del buffer[:end]
+        if header_length > self.MAX_HEADER_SIZE:
+            raise ValueError(f"Header is longer than {self.MAX_HEADER_SIZE} bytes")
+        header = self.decode_header(raw[self.PREFIX.size:self.PREFIX.size + header_length])
+        return Frame(self, header, raw[self.PREFIX.size + header_length:], raw)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), CompactCodec())}
+
+
+def get_codec(name):
+    """Get a codec by name, falling back to the default codec"""
+    return CODECS.get(name, CODECS[DEFAULT_CODEC])
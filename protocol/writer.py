@@ -0,0 +1,119 @@
+"""
+Coalescing Writer Module
+Collects frames bound for one socket and flushes them with a single
+sendmsg (writev) call, handling partial writes
+"""
+
+import threading
+import time
+
+# Most platforms cap the number of buffers per sendmsg call at 1024 (IOV_MAX)
+MAX_BUFFERS_PER_CALL = 1024
+
+
+class CoalescingWriter:
+    def __init__(self, sock, window=0.002, max_bytes=64 * 1024, max_pending=4 * 1024 * 1024, error_callback=None):
+        """
+        window: seconds to wait for more frames after the first one is queued
+        max_bytes: flush immediately once this many bytes are queued
+        max_pending: refuse new frames beyond this many queued bytes (slow receiver)
+        error_callback: called with the exception when a flush fails
+        """
+        self.socket = sock
+        self.window = window
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.error_callback = error_callback
+        self.pending = []
+        self.pending_bytes = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.use_sendmsg = hasattr(sock, 'sendmsg')
+
+        # Counters for benchmarks and diagnostics
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.syscalls = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, data, size=None):
+        """Queue a frame; returns False if the writer is closed or the receiver is too far behind
+
+        data may also be a callable returning the frame bytes, rendered just before the
+        flush that sends it; size is then its expected length for the byte budgets.
+        """
+        size = len(data) if size is None else size
+        with self.condition:
+            if self.closed or self.pending_bytes + size > self.max_pending:
+                return False
+            self.pending.append(data)
+            self.pending_bytes += size
+            self.condition.notify()
+        return True
+
+    def run(self):
+        """Flush loop - waits for frames, lets a burst build up and writes it in one go"""
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+
+                # Give a burst a short window to fill up before flushing
+                deadline = time.monotonic() + self.window
+                while not self.closed and self.pending_bytes < self.max_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                frames = self.pending
+                self.pending = []
+                self.pending_bytes = 0
+
+            try:
+                self.send_all([frame() if callable(frame) else frame for frame in frames])
+            except Exception as e:
+                with self.condition:
+                    self.closed = True
+                    self.pending = []
+                    self.pending_bytes = 0
+                if self.error_callback:
+                    self.error_callback(e)
+                return
+
+    def send_all(self, frames):
+        """Send every frame, resuming after partial writes"""
+        count = len(frames)
+        total = sum(len(frame) for frame in frames)
+        if not self.use_sendmsg:
+            self.syscalls += 1
+            self.socket.sendall(b"".join(frames))
+        else:
+            buffers = [memoryview(frame) for frame in frames]
+            start = 0
+            while start < len(buffers):
+                sent = self.socket.sendmsg(buffers[start:start + MAX_BUFFERS_PER_CALL])
+                self.syscalls += 1
+                # Skip fully written buffers and trim the partially written one
+                while start < len(buffers) and sent >= len(buffers[start]):
+                    sent -= len(buffers[start])
+                    start += 1
+                if sent:
+                    buffers[start] = buffers[start][sent:]
+        self.frames_written += count
+        self.bytes_written += total
+
+    def close(self, flush=False, timeout=5.0):
+        """Stop the writer, optionally sending whatever is still queued first"""
+        with self.condition:
+            if not flush:
+                self.pending = []
+                self.pending_bytes = 0
+            self.closed = True
+            self.condition.notify()
+        if threading.current_thread() is not self.thread:
+            self.thread.join(timeout)
@@ -5,18 +5,19 @@ Handles all socket connections and message broadcasting for the chat server
 
 import socket
 import threading
-import json
 import time
 from datetime import datetime
 from colorama import init, Fore, Style
+from protocol import CODECS, DEFAULT_CODEC, CoalescingWriter, clean_trace
 
 # Initialize colorama for Windows compatibility
 init(autoreset=True)
 
 class ServerSocketHandler:
-    def __init__(self, host, port):
+    def __init__(self, host, port, write_window=0.002):
         self.host = host
         self.port = port
+        self.write_window = write_window  # Seconds frames to one client are coalesced before a flush
         self.server_socket = None
         self.clients = []
         self.client_info = {}  # Store client info (address, username, etc.)
@@ -64,9 +65,19 @@ class ServerSocketHandler:
         """Accept a new client connection"""
         try:
             client_socket, address = self.server_socket.accept()
+            writer = CoalescingWriter(
+                client_socket,
+                window=self.write_window,
+                error_callback=lambda e: self.disconnect_client(client_socket)
+            )
             with self.lock:
                 self.clients.append(client_socket)
-                self.client_info[client_socket] = {'address': address, 'username': None}
+                self.client_info[client_socket] = {
+                    'address': address,
+                    'username': None,
+                    'codec': CODECS[DEFAULT_CODEC],
+                    'writer': writer
+                }
             self.log_message(f"New connection from {address}")
             return client_socket, address
         except Exception as e:
@@ -75,62 +86,125 @@ class ServerSocketHandler:
     
     def handle_client(self, client_socket, address):
         """Handle individual client connection"""
-        buffer = ""
+        buffer = bytearray()
+        codec = CODECS[DEFAULT_CODEC]
         try:
             while self.running:
                 data = client_socket.recv(1024)
                 if not data:
                     break
                     
-                buffer += data.decode()
+                buffer += data
                 
-                # Process newline-delimited JSON messages
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if not line.strip():
-                        continue
-                    
+                # Process complete frames with the codec negotiated for this client
+                while True:
                     try:
-                        message_data = json.loads(line)
-                        self.process_message(client_socket, message_data)
-                    except json.JSONDecodeError:
-                        self.log_message(f"Invalid JSON from {address}: {line}", "ERROR")
+                        frame = codec.next_frame(buffer)
+                    except ValueError as e:
+                        self.log_message(f"Invalid {codec.name} frame from {address}: {e}", "ERROR")
                         continue
+                    if frame is None:
+                        break
+                    
+                    if frame.header.get('type') == 'hello':
+                        codec = self.negotiate_codec(client_socket, frame)
+                    else:
+                        self.process_message(client_socket, frame)
                         
         except Exception as e:
             self.log_message(f"Error handling client {address}: {e}", "ERROR")
         finally:
             self.disconnect_client(client_socket)
     
-    def process_message(self, client_socket, message_data):
-        """Process incoming message from client"""
-        username = message_data.get('username', 'Unknown')
-        text = message_data.get('text', '')
+    def negotiate_codec(self, client_socket, frame):
+        """Pick the first codec offered in a client's hello and switch the connection to it"""
+        offered = frame.message().get('codecs', [])
+        name = next((name for name in offered if name in CODECS), DEFAULT_CODEC)
+        codec = CODECS[name]
+        
+        # The hello reply is always JSON; queue it and switch under the lock so no broadcast slips in between
+        with self.lock:
+            if client_socket not in self.client_info:
+                return CODECS[DEFAULT_CODEC]
+            self.client_info[client_socket]['writer'].write(CODECS[DEFAULT_CODEC].encode({'type': 'hello', 'codec': name}))
+            self.client_info[client_socket]['codec'] = codec
+        
+        self.log_message(f"Client {self.client_info.get(client_socket, {}).get('address')} using {name} codec")
+        return codec
+    
+    def process_message(self, client_socket, frame):
+        """Process incoming message from client using only its envelope header"""
+        # Drop malformed stamps from peers before adding the server's own
+        trace = clean_trace(frame.header.get('trace'))
+        if trace is not None:
+            trace['s_recv'] = time.time()
+        
+        username = frame.header.get('username', 'Unknown')
         
         # Update client info with username
         if client_socket in self.client_info:
             self.client_info[client_socket]['username'] = username
         
         # Log the message
-        self.log_message(f"Message from {username}: {text}")
+        self.log_message(f"Message from {username} ({len(frame.raw)} bytes, {frame.codec.name})")
         
         # Broadcast to all other clients
-        self.broadcast(message_data, client_socket)
+        self.broadcast(frame, client_socket)
     
-    def broadcast(self, message_data, sender_socket):
+    def encode_for(self, codec, frame, header=None):
+        """Get the bytes of a frame for a recipient codec, reusing the original bytes when possible"""
+        if codec is frame.codec:
+            # Same codec: forward the body untouched, re-packing only a replacement header
+            return codec.reencode(frame, header) if header else frame.raw
+        return codec.encode(dict(frame.message(), **header) if header else frame.message())
+    
+    def render_traced(self, codec, frame, header):
+        """Stamp s_fan_end and encode a traced frame, called by the writer just before its flush"""
+        header['trace']['s_fan_end'] = time.time()
+        try:
+            return self.encode_for(codec, frame, header)
+        except Exception as e:
+            self.log_message(f"Failed to encode message for {codec.name} client: {e}", "ERROR")
+            return b""
+    
+    def broadcast(self, frame, sender_socket):
         """Broadcast message to all clients except sender"""
-        message_json = json.dumps(message_data) + "\n"
-        message_bytes = message_json.encode()
+        trace = frame.header.get('trace')
+        traced = isinstance(trace, dict)
+        if traced:
+            trace['s_fan_start'] = time.time()
+        
+        # Encoded bytes per recipient codec, shared by every recipient using it
+        payloads = {}
         
         # Send to all clients except sender
         disconnected_clients = []
         with self.lock:
             for client in self.clients[:]:
                 if client != sender_socket:
+                    codec = self.client_info[client]['codec']
+                    writer = self.client_info[client]['writer']
                     try:
-                        client.send(message_bytes)
-                    except Exception:
-                        # Client disconnected
+                        if traced:
+                            # Each recipient gets its own trace, stamped with s_fan_end when the
+                            # writer flushes its batch, so the coalescing window counts as fan-out
+                            if codec is not frame.codec:
+                                frame.message()  # Decode once here rather than in every writer thread
+                            header = dict(frame.header, trace=dict(trace))
+                            message_bytes = lambda codec=codec, header=header: self.render_traced(codec, frame, header)
+                            size = len(frame.raw)
+                        else:
+                            size = None
+                            if codec.name not in payloads:
+                                payloads[codec.name] = self.encode_for(codec, frame)
+                            message_bytes = payloads[codec.name]
+                    except Exception as e:
+                        # A message this codec cannot carry is the sender's fault, not the recipient's
+                        self.log_message(f"Failed to encode message for {codec.name} client: {e}", "ERROR")
+                        continue
+                    # Queued frames are coalesced into one sendmsg per client
+                    if not writer.write(message_bytes, size=size):
+                        # Client disconnected or too far behind
                         disconnected_clients.append(client)
         
         # Remove disconnected clients
@@ -139,6 +213,7 @@ class ServerSocketHandler:
     
     def disconnect_client(self, client_socket):
         """Handle client disconnection"""
+        writer = None
         with self.lock:
             if client_socket in self.clients:
                 self.clients.remove(client_socket)
@@ -146,8 +221,12 @@ class ServerSocketHandler:
             if client_socket in self.client_info:
                 username = self.client_info[client_socket].get('username', 'Unknown')
                 address = self.client_info[client_socket]['address']
+                writer = self.client_info[client_socket]['writer']
                 self.log_message(f"Client {username} ({address}) disconnected")
                 del self.client_info[client_socket]
+        
+        if writer:
+            writer.close()
                 
         try:
             client_socket.close()
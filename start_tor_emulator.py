@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Dark Comm Tor Emulator Launcher
+Starts the local Tor network emulator from the root directory
+"""
+
+import sys
+import os
+
+# Add the tor_emulator directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'tor_emulator'))
+
+from emulator import main
+
+if __name__ == "__main__":
+    main()
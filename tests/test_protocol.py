@@ -0,0 +1,114 @@
+"""
+Protocol tests
+Checks that malformed frames are rejected without dropping the connection
+"""
+
+import os
+import sys
+import socket
+import threading
+import time
+
+import pytest
+
+# Add the project root to the Python path, and the client directory after it
+# for the modules client/socket_handler.py imports directly
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.join(ROOT, 'client'))
+
+from protocol import CODECS
+
+
+def malformed_extra_frame(extra_json):
+    """Build a compact frame whose extra body field holds extra_json"""
+    codec = CODECS['compact']
+    body = bytearray()
+    codec._pack_string(body, codec.EXTRA_TAG, extra_json)
+    return codec.pack(codec.encode_header({'username': 'evil'}), bytes(body))
+
+
+@pytest.mark.parametrize("extra_json", ["[1, 2]", "5", "\"text\""])
+def test_extra_field_must_be_an_object(extra_json):
+    frame = CODECS['compact'].next_frame(bytearray(malformed_extra_frame(extra_json)))
+    with pytest.raises(ValueError):
+        frame.message()
+
+
+def start_server():
+    """Start a chat server on a free local port"""
+    from server.socket_handler import ServerSocketHandler
+
+    server = ServerSocketHandler('127.0.0.1', 0)
+    assert server.create_socket()
+    server.server_socket.bind(('127.0.0.1', 0))
+    server.port = server.server_socket.getsockname()[1]
+    assert server.start_listening()
+    server.running = True
+    threading.Thread(target=server.run_server_loop, daemon=True).start()
+    return server
+
+
+def connect_compact_sender(server):
+    """Open a raw socket to the server and negotiate the compact codec on it"""
+    sender = socket.create_connection(('127.0.0.1', server.port))
+    sender.sendall(CODECS['json'].encode({'type': 'hello', 'codecs': ['compact']}))
+    reply = b""
+    while not reply.endswith(b"\n"):
+        reply += sender.recv(1)
+    return sender
+
+
+def wait_for(received):
+    """Wait up to two seconds for a message to arrive"""
+    deadline = time.monotonic() + 2
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_malformed_extra_field_keeps_recipient_connected():
+    pytest.importorskip("colorama")
+    pytest.importorskip("socks")
+    from client.socket_handler import ClientSocketHandler
+
+    server = start_server()
+    received = []
+    recipient = ClientSocketHandler('127.0.0.1', server.port, codec='compact')
+    assert recipient.run_client(received.append, lambda error: None)
+    assert recipient.codec.name == 'compact'
+
+    # Send a bad frame followed by a good one
+    sender = connect_compact_sender(server)
+    sender.sendall(malformed_extra_frame("[1, 2]"))
+    sender.sendall(CODECS['compact'].encode({'username': 'ok', 'text': 'after'}))
+
+    wait_for(received)
+    sender.close()
+
+    assert [message['text'] for message in received] == ['after']
+    assert recipient.is_connected()
+    recipient.cleanup()
+
+
+def test_undecodable_traced_body_keeps_sender_connected():
+    pytest.importorskip("colorama")
+    pytest.importorskip("socks")
+    from client.socket_handler import ClientSocketHandler
+
+    server = start_server()
+    received = []
+    recipient = ClientSocketHandler('127.0.0.1', server.port, codec='json')
+    assert recipient.run_client(received.append, lambda error: None)
+
+    # A traced frame whose text is not UTF-8 can only fail when re-encoded for the JSON recipient
+    codec = CODECS['compact']
+    header = codec.encode_header({'username': 'evil', 'trace': {'c_send': time.time()}})
+    sender = connect_compact_sender(server)
+    sender.sendall(codec.pack(header, bytes([2, 1, 0xFF])))
+    sender.sendall(codec.encode({'username': 'ok', 'text': 'after', 'trace': {'c_send': time.time()}}))
+
+    wait_for(received)
+    sender.close()
+
+    assert [message['text'] for message in received] == ['after']
+    recipient.cleanup()
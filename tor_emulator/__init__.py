@@ -0,0 +1,7 @@
+"""
+Tor emulator package for Dark Comm Terminal Chat
+"""
+
+from .socks_proxy import TorEmulatorProxy, parse_onion_map
+
+__all__ = ['TorEmulatorProxy', 'parse_onion_map']
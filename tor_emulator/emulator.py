@@ -0,0 +1,66 @@
+"""
+Dark Comm Tor Emulator
+Local SOCKS5 stand-in for the Tor daemon, for offline and reproducible testing
+"""
+
+import os
+from dotenv import load_dotenv
+from socks_proxy import TorEmulatorProxy, parse_onion_map
+
+# Load environment variables
+load_dotenv()
+
+proxy_host = os.getenv("EMULATOR_HOST", "127.0.0.1")
+proxy_port = int(os.getenv("EMULATOR_PORT", 9050))
+onion_map = parse_onion_map(os.getenv("ONION_MAP", "localchat.onion=127.0.0.1:4444"))
+circuit_build_delay = float(os.getenv("CIRCUIT_BUILD_DELAY", 0))
+cell_latency = float(os.getenv("CELL_LATENCY", 0))
+jitter = float(os.getenv("JITTER", 0))
+bandwidth = int(os.getenv("BANDWIDTH", 0))
+circuit_lifetime = float(os.getenv("CIRCUIT_LIFETIME", 0))
+allow_clearnet = os.getenv("ALLOW_CLEARNET", "0").lower() in ("1", "true", "yes")
+seed = os.getenv("SEED")
+
+def display_emulator_info():
+    """Display emulator startup information"""
+    print(f"{'='*60}")
+    print(f"Tor Network Emulator (SOCKS5)")
+    print(f"{'='*60}")
+    print(f"SOCKS5 proxy: {proxy_host}:{proxy_port}")
+    for name, (host, port) in onion_map.items():
+        print(f"  {name} -> {host}:{port}")
+    print(f"Circuit build delay: {circuit_build_delay}s")
+    print(f"Cell latency: {cell_latency}s (+ up to {jitter}s jitter)")
+    print(f"Bandwidth cap: {f'{bandwidth} B/s' if bandwidth else 'unlimited'}")
+    print(f"Circuit lifetime: {f'{circuit_lifetime}s mean' if circuit_lifetime else 'unlimited'}")
+    print(f"{'='*60}")
+    print()
+
+def main():
+    """Main emulator function"""
+    proxy = TorEmulatorProxy(
+        proxy_host, proxy_port,
+        onion_map=onion_map,
+        circuit_build_delay=circuit_build_delay,
+        cell_latency=cell_latency,
+        jitter=jitter,
+        bandwidth=bandwidth,
+        circuit_lifetime=circuit_lifetime,
+        allow_clearnet=allow_clearnet,
+        seed=int(seed) if seed else None
+    )
+    try:
+        if not proxy.start_server():
+            print("Failed to start Tor emulator")
+            return
+        display_emulator_info()
+        proxy.run_server_loop()
+    except KeyboardInterrupt:
+        print("\nKeyboard interrupt received, shutting down emulator...")
+    except Exception as e:
+        print(f"Emulator error: {e}")
+    finally:
+        proxy.cleanup()
+
+if __name__ == "__main__":
+    main()
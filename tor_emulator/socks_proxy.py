@@ -0,0 +1,391 @@
+"""
+Tor Emulator SOCKS5 Proxy Module
+Local SOCKS5 stand-in for the Tor daemon that maps fake .onion names to local
+servers and shapes traffic like a Tor circuit (build delay, cell latency,
+jitter, bandwidth caps and random circuit teardown)
+"""
+
+import socket
+import struct
+import threading
+import queue
+import random
+import time
+from datetime import datetime
+from colorama import init, Fore, Style
+
+# Initialize colorama for Windows compatibility
+init(autoreset=True)
+
+# Relay cell payload size used by Tor for stream data
+CELL_PAYLOAD_SIZE = 498
+
+# Cells buffered per direction before reads from the sender stop (about 64 KB)
+MAX_QUEUED_CELLS = 128
+
+SOCKS_VERSION = 5
+CMD_CONNECT = 1
+ATYP_IPV4 = 1
+ATYP_DOMAIN = 3
+ATYP_IPV6 = 4
+
+REPLY_SUCCEEDED = 0
+REPLY_GENERAL_FAILURE = 1
+REPLY_HOST_UNREACHABLE = 4
+REPLY_CONNECTION_REFUSED = 5
+REPLY_COMMAND_NOT_SUPPORTED = 7
+REPLY_ADDRESS_NOT_SUPPORTED = 8
+
+
+def parse_onion_map(value):
+    """Parse 'name.onion=host:port,other.onion=host:port' into a dict"""
+    onion_map = {}
+    for entry in (value or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, target = entry.split("=", 1)
+        host, port = target.rsplit(":", 1)
+        onion_map[name.strip().lower()] = (host.strip(), int(port))
+    return onion_map
+
+
+def recv_exact(sock, count):
+    """Receive exactly count bytes or raise ConnectionError"""
+    data = b""
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed during SOCKS handshake")
+        data += chunk
+    return data
+
+
+class TorEmulatorProxy:
+    def __init__(self, host="127.0.0.1", port=9050, onion_map=None,
+                 circuit_build_delay=0.0, cell_latency=0.0, jitter=0.0,
+                 bandwidth=0, circuit_lifetime=0.0, allow_clearnet=False, seed=None):
+        """
+        circuit_build_delay: seconds before a new circuit is connected
+        cell_latency: one-way delay in seconds added to every cell
+        jitter: maximum extra random delay in seconds per cell
+        bandwidth: per-direction cap in bytes per second (0 = unlimited)
+        circuit_lifetime: mean seconds before a circuit is torn down (0 = never)
+        """
+        self.host = host
+        self.port = port
+        self.onion_map = {name.lower(): target for name, target in (onion_map or {}).items()}
+        self.circuit_build_delay = circuit_build_delay
+        self.cell_latency = cell_latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.circuit_lifetime = circuit_lifetime
+        self.allow_clearnet = allow_clearnet
+        self.seed = seed
+        self.circuit_count = 0
+        self.server_socket = None
+        self.circuits = {}  # client socket -> target socket
+        self.running = False
+        self.lock = threading.Lock()
+
+    def log_message(self, message, level="INFO"):
+        """Log messages with timestamp and color coding"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        color = Fore.GREEN if level == "INFO" else Fore.RED if level == "ERROR" else Fore.YELLOW
+        print(f"{color}[{timestamp}] {level}: {message}{Style.RESET_ALL}")
+
+    def circuit_random(self, index, purpose):
+        """Get a random generator for one circuit and purpose, repeatable when a seed is set
+
+        Each circuit direction gets its own generator, so thread interleaving
+        cannot change the sequence any of them produces.
+        """
+        if self.seed is None:
+            return random.Random()
+        return random.Random(f"{self.seed}:{index}:{purpose}")
+
+    def random_jitter(self, rng):
+        """Get a random jitter delay in seconds"""
+        return rng.uniform(0, self.jitter) if self.jitter else 0.0
+
+    def resolve(self, address, port):
+        """Map a requested address to a local (host, port), or None if unreachable"""
+        if address.lower().endswith(".onion"):
+            target = self.onion_map.get(address.lower())
+            if target is None:
+                self.log_message(f"Unknown onion address {address}", "WARNING")
+            return target
+        if self.allow_clearnet:
+            return address, port
+        self.log_message(f"Refusing clearnet address {address}:{port}", "WARNING")
+        return None
+
+    def send_reply(self, client_socket, reply_code):
+        """Send a SOCKS5 reply with an empty IPv4 bind address"""
+        client_socket.sendall(struct.pack("!BBBB4sH", SOCKS_VERSION, reply_code, 0, ATYP_IPV4, b"\x00" * 4, 0))
+
+    def read_request(self, client_socket):
+        """Perform the SOCKS5 greeting and read the CONNECT request"""
+        version, method_count = recv_exact(client_socket, 2)
+        if version != SOCKS_VERSION:
+            raise ConnectionError(f"Unsupported SOCKS version {version}")
+        methods = recv_exact(client_socket, method_count)
+        if 0 not in methods:
+            client_socket.sendall(bytes([SOCKS_VERSION, 0xFF]))
+            raise ConnectionError("Client offered no supported authentication method")
+        client_socket.sendall(bytes([SOCKS_VERSION, 0]))
+
+        version, command, _, address_type = recv_exact(client_socket, 4)
+        if address_type == ATYP_IPV4:
+            address = socket.inet_ntop(socket.AF_INET, recv_exact(client_socket, 4))
+        elif address_type == ATYP_DOMAIN:
+            length = recv_exact(client_socket, 1)[0]
+            address = recv_exact(client_socket, length).decode()
+        elif address_type == ATYP_IPV6:
+            address = socket.inet_ntop(socket.AF_INET6, recv_exact(client_socket, 16))
+        else:
+            self.send_reply(client_socket, REPLY_ADDRESS_NOT_SUPPORTED)
+            raise ConnectionError(f"Unsupported address type {address_type}")
+        port = struct.unpack("!H", recv_exact(client_socket, 2))[0]
+
+        if command != CMD_CONNECT:
+            self.send_reply(client_socket, REPLY_COMMAND_NOT_SUPPORTED)
+            raise ConnectionError(f"Unsupported SOCKS command {command}")
+        return address, port
+
+    def handle_client(self, client_socket, address, index):
+        """Handshake with a SOCKS client, build the emulated circuit and relay data
+
+        index is the circuit's number in accept order, used to seed its generators.
+        """
+        target_socket = None
+        try:
+            requested_host, requested_port = self.read_request(client_socket)
+            target = self.resolve(requested_host, requested_port)
+            if target is None:
+                self.send_reply(client_socket, REPLY_HOST_UNREACHABLE)
+                return
+
+            circuit_rng = self.circuit_random(index, "circuit")
+
+            # Emulate circuit construction
+            delay = self.circuit_build_delay + self.random_jitter(circuit_rng)
+            if delay:
+                time.sleep(delay)
+
+            try:
+                target_socket = socket.create_connection(target)
+            except OSError as e:
+                self.log_message(f"Failed to reach {target[0]}:{target[1]}: {e}", "ERROR")
+                self.send_reply(client_socket, REPLY_CONNECTION_REFUSED)
+                return
+
+            self.send_reply(client_socket, REPLY_SUCCEEDED)
+            with self.lock:
+                self.circuits[client_socket] = target_socket
+            self.log_message(f"Circuit {address} -> {requested_host}:{requested_port} built in {delay:.2f}s")
+
+            self.schedule_teardown(client_socket, target_socket, circuit_rng)
+            upstream = threading.Thread(
+                target=self.relay,
+                args=(client_socket, target_socket, self.circuit_random(index, "upstream")),
+                daemon=True
+            )
+            upstream.start()
+            self.relay(target_socket, client_socket, self.circuit_random(index, "downstream"))
+            upstream.join()
+        except Exception as e:
+            self.log_message(f"Error handling client {address}: {e}", "ERROR")
+        finally:
+            self.close_circuit(client_socket, target_socket)
+
+    def schedule_teardown(self, client_socket, target_socket, rng):
+        """Tear the circuit down after a random, exponentially distributed lifetime"""
+        if not self.circuit_lifetime:
+            return
+        lifetime = rng.expovariate(1.0 / self.circuit_lifetime)
+
+        def teardown():
+            with self.lock:
+                alive = self.circuits.get(client_socket) is target_socket
+            if alive:
+                self.log_message(f"Tearing down circuit after {lifetime:.1f}s", "WARNING")
+                self.close_circuit(client_socket, target_socket)
+
+        timer = threading.Timer(lifetime, teardown)
+        timer.daemon = True
+        timer.start()
+
+    def relay(self, source, destination, rng):
+        """Relay data in one direction, delaying each cell by latency, jitter and bandwidth
+
+        Reads from the source are paced to the bandwidth cap and stop while the
+        cell queue is full, so a slow link backs up into the sender's socket.
+        Cells are cut at fixed 498-byte offsets of the stream, not per read, and
+        draw one jitter value each, so jitter does not depend on how recv splits data.
+        """
+        cells = queue.Queue(maxsize=MAX_QUEUED_CELLS)
+        failed = threading.Event()
+
+        def deliver():
+            while True:
+                due, data = cells.get()
+                if data is None:
+                    break
+                if failed.is_set():
+                    # Keep draining so the reader never blocks on a full queue
+                    continue
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    destination.sendall(data)
+                except OSError:
+                    failed.set()
+            self.shutdown_socket(destination)
+
+        writer = threading.Thread(target=deliver, daemon=True)
+        writer.start()
+
+        last_due = 0.0
+        link_free = 0.0  # When the emulated link finishes transmitting the queued cells
+        relayed = 0  # Bytes relayed so far; cell boundaries fall at multiples of CELL_PAYLOAD_SIZE
+        cell_jitter = 0.0
+        try:
+            while self.running and not failed.is_set():
+                if self.bandwidth:
+                    # Don't read more than the link can carry
+                    backlog = link_free - time.monotonic()
+                    if backlog > 0:
+                        time.sleep(backlog)
+                    read_size = max(CELL_PAYLOAD_SIZE, min(4096, int(self.bandwidth * 0.1)))
+                else:
+                    read_size = 4096
+                data = source.recv(read_size)
+                if not data:
+                    break
+                now = time.monotonic()
+                position = 0
+                while position < len(data):
+                    offset_in_cell = relayed % CELL_PAYLOAD_SIZE
+                    if offset_in_cell == 0:
+                        cell_jitter = self.random_jitter(rng)
+                    # A cell split across reads is sent as it arrives but keeps one jitter value
+                    length = min(CELL_PAYLOAD_SIZE - offset_in_cell, len(data) - position)
+                    cell = data[position:position + length]
+                    position += length
+                    relayed += length
+                    sent_at = now
+                    if self.bandwidth:
+                        # A cell cannot leave before the link has finished sending the previous one
+                        link_free = max(link_free, now) + len(cell) / self.bandwidth
+                        sent_at = link_free
+                    due = sent_at + self.cell_latency + cell_jitter
+                    # Cells on a circuit are delivered in order
+                    last_due = max(due, last_due)
+                    cells.put((last_due, cell))
+        except OSError:
+            pass
+        finally:
+            cells.put((0.0, None))
+            writer.join()
+
+    def shutdown_socket(self, sock):
+        """Signal end of stream on a socket without closing it"""
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def close_circuit(self, client_socket, target_socket):
+        """Close both ends of a circuit"""
+        with self.lock:
+            self.circuits.pop(client_socket, None)
+        for sock in (client_socket, target_socket):
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def get_circuit_count(self):
+        """Get the number of open circuits"""
+        with self.lock:
+            return len(self.circuits)
+
+    def start_server(self):
+        """Create, bind and listen on the SOCKS socket"""
+        try:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(16)
+            # Pick up the real port when bound to port 0
+            self.port = self.server_socket.getsockname()[1]
+        except Exception as e:
+            self.log_message(f"Failed to start SOCKS5 proxy: {e}", "ERROR")
+            return False
+
+        self.running = True
+        self.log_message(f"Tor emulator SOCKS5 proxy listening on {self.host}:{self.port}")
+        return True
+
+    def run_server_loop(self):
+        """Main proxy loop - accepts SOCKS clients and handles them"""
+        if not self.running:
+            self.log_message("Proxy not started. Call start_server() first.", "ERROR")
+            return
+
+        try:
+            while self.running:
+                try:
+                    client_socket, address = self.server_socket.accept()
+                except OSError:
+                    if self.running:
+                        self.log_message("Error accepting connection", "ERROR")
+                    continue
+                # Number circuits here, before handshake timing can reorder them
+                index = self.circuit_count
+                self.circuit_count += 1
+                client_thread = threading.Thread(
+                    target=self.handle_client,
+                    args=(client_socket, address, index),
+                    daemon=True
+                )
+                client_thread.start()
+        finally:
+            self.stop_server()
+
+    def start_in_background(self):
+        """Start the proxy loop in a daemon thread, e.g. for performance tests"""
+        if not self.running and not self.start_server():
+            return None
+        thread = threading.Thread(target=self.run_server_loop, daemon=True)
+        thread.start()
+        return thread
+
+    def stop_server(self):
+        """Stop the proxy and tear down all circuits"""
+        self.running = False
+
+        with self.lock:
+            circuits = list(self.circuits.items())
+        for client_socket, target_socket in circuits:
+            self.close_circuit(client_socket, target_socket)
+
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+            except OSError:
+                pass
+
+        self.log_message("Tor emulator stopped")
+
+    def cleanup(self):
+        """Clean up all resources"""
+        self.stop_server()